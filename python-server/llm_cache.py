@@ -0,0 +1,84 @@
+import os
+import orjson
+import time
+import logging
+from collections import OrderedDict
+
+# Redis is optional: only used when REDIS_URL is set and the client is installed
+try:
+    import redis.asyncio as aioredis
+except Exception:
+    aioredis = None
+
+LOG = logging.getLogger("toc.cache")
+
+REDIS_URL = os.environ.get("REDIS_URL", "")
+# Default TTL for cached LLM results (seconds)
+DEFAULT_TTL = 4 * 60 * 60
+
+
+class InMemoryLLMCache:
+    """
+    Process-local LRU cache for LLM results. Values are stored orjson-encoded so
+    callers never share (and mutate) the same objects across requests.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    async def get(self, key):
+        item = self._data.get(key)
+        if item is not None:
+            expires_at, raw = item
+            if expires_at is None or expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                return orjson.loads(raw)
+            del self._data[key]
+        return None
+
+    async def set(self, key, value, ttl=DEFAULT_TTL):
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._data[key] = (expires_at, orjson.dumps(value))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def close(self):
+        self._data.clear()
+
+
+class RedisLLMCache:
+    """Shared cache backed by Redis `SET EX`, for multi-worker deployments."""
+
+    def __init__(self, url):
+        self._client = aioredis.from_url(url)
+
+    async def get(self, key):
+        try:
+            raw = await self._client.get(key)
+        except Exception as e:
+            LOG.warning("Redis cache get failed: %s", e)
+            raw = None
+        return orjson.loads(raw) if raw is not None else None
+
+    async def set(self, key, value, ttl=DEFAULT_TTL):
+        try:
+            await self._client.set(key, orjson.dumps(value), ex=ttl)
+        except Exception as e:
+            LOG.warning("Redis cache set failed: %s", e)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def _make_backend():
+    if REDIS_URL and aioredis is not None:
+        return RedisLLMCache(REDIS_URL)
+    if REDIS_URL:
+        LOG.warning("REDIS_URL set but redis is not installed; using in-memory LLM cache.")
+    return InMemoryLLMCache()
+
+
+# Shared by the API endpoints and the TOC extraction logic
+backend = _make_backend()
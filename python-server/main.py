@@ -2,16 +2,23 @@
 # --- BEGIN: Integrated image-based TOC extraction logic ---
 import re
 import os
+import asyncio
+import hashlib
 import requests
+from requests.adapters import HTTPAdapter
 import tempfile
-import json
+import orjson
+from contextlib import asynccontextmanager
+import httpx
+import aiofiles
 from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
 from dotenv import load_dotenv
 
 # Load environment variables from a .env file if present
 load_dotenv()
 import sys
+import logging
 try:
     # Ensure stdout/stderr use UTF-8 on Windows consoles to avoid UnicodeEncodeError
     if hasattr(sys.stdout, "reconfigure"):
@@ -22,47 +29,102 @@ except Exception:
     pass
 # Remove PyPDF2 import, not needed for new workflow
 
+# Configure logging before importing toc_logic, which logs at import time.
+# LOG_LEVEL=DEBUG restores the verbose request/response dumps.
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+LOG = logging.getLogger("toc.api")
+# httpx logs every request URL at INFO; keep client chatter out of python.log
+for _name in ("httpx", "httpcore"):
+    logging.getLogger(_name).setLevel(logging.WARNING)
+
 # Import the new TOC extraction logic
 import toc_logic
-
-app = FastAPI()
+import llm_cache
 
 # Read Gemini API key from env var, fallback to empty string if not set
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")
 # Allow overriding the Java headings service URL via env var for local runs
 JAVA_HEADINGS_URL = os.environ.get("JAVA_HEADINGS_URL", "http://localhost:8080/get/pdf-info/detect-chapter-headings")
+# (connect, read) timeouts for outbound HTTP calls
+HTTP_TIMEOUT = (5, 180)
+
+# One pooled session for the (threaded) Java headings calls so keep-alive
+# connections are reused instead of re-handshaking per request. No retries: the
+# Java call is a heavy, non-idempotent POST, and a deterministic 500 must not
+# re-run the PDF analysis. https:// only matters for a remote JAVA_HEADINGS_URL.
+SESSION = requests.Session()
+for _prefix in ("http://", "https://"):
+    SESSION.mount(_prefix, HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
+# Async client for Gemini calls, created in the app lifespan. Gemini requests
+# take seconds, so they must not block the event loop like `requests` would.
+ASYNC_HTTP = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global ASYNC_HTTP
+    ASYNC_HTTP = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(180.0),
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+    )
+    try:
+        yield
+    finally:
+        await ASYNC_HTTP.aclose()
+        ASYNC_HTTP = None
+        SESSION.close()
+        await llm_cache.backend.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# How long (seconds) a full pipeline result is reused for identical uploads
+PIPELINE_CACHE_TTL = int(os.environ.get("PIPELINE_CACHE_TTL", "14400"))
+# Hit/miss counters for the full-pipeline cache (exposed via /metrics)
+pipeline_stats = {"hits": 0, "misses": 0}
+
+# Markdown chapter lines, e.g. "* Chapter 3: Title: 42"
+_CHAP_RE = re.compile(r"\*\s*Chapter\s*(\d+):\s*(.*?):\s*(\d+)")
+
+# Markdown code fence around a JSON reply, e.g. ```json ... ```; either fence may be
+# missing (a truncated reply has only the opening one)
+_FENCE_RE = re.compile(r"^\s*(?:```(?:json)?)?\s*(.*?)\s*(?:```)?\s*$", re.DOTALL)
 
 # This is a fallback parser if Gemini returns markdown instead of JSON
 def parse_chapter_list(text_response):
-    pattern = r"\*\s*Chapter\s*(\d+):\s*(.*?):\s*(\d+)"
-    chapters = []
-    for match in re.finditer(pattern, text_response):
-        chapters.append({
-            "chapter_number": int(match.group(1)),
-            "chapter_title": match.group(2).strip(),
-            "page_number": int(match.group(3))
-        })
-    return chapters
+    return [
+        {
+            "chapter_number": int(number),
+            "chapter_title": title.strip(),
+            "page_number": int(page)
+        }
+        for number, title, page in _CHAP_RE.findall(text_response)
+    ]
 
 async def get_toc_from_new_logic(pdf_path: str):
     """
     Wrapper function to call the new image-based TOC extraction logic.
     """
-    print("[DEBUG] Starting new image-based TOC extraction from toc_logic.py")
+    LOG.debug("Starting new image-based TOC extraction from toc_logic.py")
     if not GEMINI_API_KEY:
-        print("[DEBUG] GEMINI_API_KEY not set, skipping new TOC logic.")
+        LOG.warning("GEMINI_API_KEY not set, skipping new TOC logic.")
         return []
     try:
         # Call the async process_pdf function from the new module
         result_json = await toc_logic.process_pdf(pdf_path)
         if result_json and "toc_entries" in result_json:
-            print("[DEBUG] Successfully extracted TOC using new image-based logic.")
+            LOG.debug("Successfully extracted TOC using new image-based logic.")
             return result_json
         else:
-            print("[DEBUG] New TOC extraction logic returned no entries.")
+            LOG.info("New TOC extraction logic returned no entries.")
             return None
     except Exception as e:
-        print(f"[DEBUG] An error occurred while running the new TOC logic: {e}")
+        LOG.error("An error occurred while running the new TOC logic: %s", e)
         return None
 
 
@@ -71,27 +133,74 @@ def get_java_headings(pdf_path):
     with open(pdf_path, "rb") as f:
         files = {"file": f}
         try:
-            response = requests.post(url, files=files, timeout=180)
-            print("[DEBUG] Java headings API status:", response.status_code)
+            response = SESSION.post(url, files=files, timeout=HTTP_TIMEOUT)
+            LOG.debug("Java headings API status: %s", response.status_code)
             if response.status_code == 200:
-                headings_data = response.json()
-                print("[DEBUG] Java headings raw response:", headings_data)
+                headings_data = orjson.loads(response.content)
+                LOG.debug("Java headings raw response: %s", headings_data)
                 if isinstance(headings_data, dict) and "headings" in headings_data:
                     return headings_data["headings"]
                 return headings_data
         except Exception as e:
-            print("[DEBUG] Java headings API exception:", e)
+            LOG.warning("Java headings API exception: %s", e)
             return {"error": str(e)}
     return []
 
 
-def match_toc_with_java_headings_gemini(toc, java_headings, book_title):
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key=" + GEMINI_API_KEY
+async def _java_async(pdf_path):
+    # get_java_headings uses blocking I/O; keep it off the event loop
+    return await asyncio.to_thread(get_java_headings, pdf_path)
+
+
+# The match prompt is constant apart from the book title and the two JSON payloads,
+# so its static parts are assembled once at import time.
+_MATCH_PROMPT_HEAD_A = (
+    "You are an expert data-cleaning and text-matching AI. Your task is to create a final, accurate Table of Contents (TOC) for the book '"
+)
+_MATCH_PROMPT_HEAD_B = (
+    "'.\n\n"
+    "You will be given two lists:\n"
+    "1.  **[TOC LIST]**: The definitive, 100% correct list of chapter titles.\n"
+    "2.  **[JAVA HEADINGS LIST]**: A very noisy and unreliable list of text fragments and their page numbers extracted from the book. This list contains many errors, random words, and chapter titles that are split across multiple lines.\n"
+    "\nYour mission is to use the noisy [JAVA HEADINGS LIST] ONLY to find the correct starting page number for each real chapter in the [TOC LIST].\n"
+    "-----\n"
+    "### CRITICAL RULES FOR SUCCESS:\n"
+    "**1. Aggressively Ignore Noise:** The [JAVA HEADINGS LIST] is messy. You MUST completely ignore entries that are clearly not chapter titles. These include:\n"
+    "* **Single, common words:** Ignore entries like 'the', 'past', 'of', 'a', etc.\n"
+    "* **Symbols and Junk:** Ignore entries that are just symbols, punctuation, or malformed text (e.g., '*', '/', '[', ']').\n"
+    "* **Generic Capitalized Words:** Ignore standalone, capitalized words that are unlikely to be full chapter titles (e.g., 'LEVEL', 'FUTURE').\n"
+    "**2. Reconstruct Fragmented Titles:** This is the most important challenge. A chapter title like 'LSD PSYCHOTHERAPY' might be split in the noisy data like this:\n"
+    "{ 'title': 'LSD', 'pageNumber': 262 }\n"
+    "{ 'title': 'PSYCHOTHERAPY', 'pageNumber': 262 }\n"
+    "* **Your Strategy:** You must look for **consecutive entries** in the [JAVA HEADINGS LIST] that appear on the **same page number**.\n"
+    "* When you find such a sequence, combine their 'title' fields. If the combined text matches a chapter from the [TOC LIST], you have found a match.\n"
+    "* The correct page number for the chapter is the page number of the **first** entry in that sequence.\n"
+    "**3. Use Logical Reasoning to Resolve Ambiguity:**\n"
+    "* **Chronological Order is Mandatory:** Chapter page numbers MUST increase sequentially. Chapter 5 cannot start on a page that comes after Chapter 6. Use this to eliminate impossible matches.\n"
+    "* **Plausible Chapter Length:** If you are unsure between two possible page numbers for a chapter, consider the page numbers of the chapters before and after it. If one choice makes the chapter only one or two pages long while all other chapters are 20 pages long, it is almost certainly the wrong choice. Select the page number that results in a more logical and balanced book structure.\n"
+    "**4. Be Flexible with Minor Differences:** A chapter in the [TOC LIST] might be 'The Coming Storm', while the data has 'COMING STORM'. This is a valid match. Ignore differences in capitalization and minor words like 'The', 'A', or 'An'.\n"
+    "**5. Extra hints:  'level': 1: This means the heading's font size is 2 points or more larger than the average. This is a strong signal that the text is a primary heading, like a chapter title. The 'level': 0: This means the font size is less than 2 points larger than the average, so it's less likely to be a header. Best to see if you can match everything with level 1, and only then start looking at level 0 if needed.\n"
+    "-----\n"
+    "### YOUR INPUTS:\n"
+    "**[TOC LIST]**\n"
+)
+_MATCH_PROMPT_MID = "\n**[JAVA HEADINGS LIST]**\n"
+_MATCH_PROMPT_TAIL = (
+    "\n-----\n"
+    "### YOUR TASK:\n"
+    "Now, analyze the two lists according to the critical rules above.\n"
+    "Your output response should be ALWAYS return in JSON format, never anything else. Return only valid JSON in your reply with no Markdown, code blocks, comments, or explanations; the response must be a single JSON object that exactly matches the required keys and structure I provide, with no extra characters or formatting, and if you cannot comply output an empty JSON object {} instead.\n"
+    "JSON format: \n[\n    {\"title\": \"LEVEL\",\"pageNumber\": 253,\"level\": 1},\n    {\"title\": \"the\",\"pageNumber\": 256,\"level\": 1},\n    {\"title\": \"Edgar\",\"pageNumber\": 256,\"level\": 1},\n    {\"title\": \"past\",\"pageNumber\": 256,\"level\": 1},\n    {\"title\": \"FUTURE\",\"pageNumber\": 262,\"level\": 1},\n    {\"title\": \"*\",\"pageNumber\": 262,\"level\": 1},\n    {\"title\": \"LSD\",\"pageNumber\": 262,\"level\": 1},\n    {\"title\": \"PSYCHOTHERAPY\",\"pageNumber\": 262,\"level\": 1}\n]"
+)
+
+
+async def match_toc_with_java_headings_gemini(toc, java_headings, book_title):
+    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
 
     # --- IMPORTANT CHANGE ---
     # Reformat the TOC to remove page numbers and other extra fields
     # before sending it to the final matching prompt.
-    print("[DEBUG] Raw TOC passed to final matching step:", toc)
+    LOG.debug("Raw TOC passed to final matching step: %s", toc)
     formatted_toc_for_prompt = [
         {
             "chapter_title": entry.get("chapter_title"),
@@ -99,88 +208,75 @@ def match_toc_with_java_headings_gemini(toc, java_headings, book_title):
         }
         for entry in toc
     ]
-    print("[DEBUG] Formatted TOC for final prompt (should NOT include page_number):", formatted_toc_for_prompt)
-
-    prompt = (
-        f"You are an expert data-cleaning and text-matching AI. Your task is to create a final, accurate Table of Contents (TOC) for the book '{book_title}'.\n\n"
-        "You will be given two lists:\n"
-        "1.  **[TOC LIST]**: The definitive, 100% correct list of chapter titles.\n"
-        "2.  **[JAVA HEADINGS LIST]**: A very noisy and unreliable list of text fragments and their page numbers extracted from the book. This list contains many errors, random words, and chapter titles that are split across multiple lines.\n"
-        "\nYour mission is to use the noisy [JAVA HEADINGS LIST] ONLY to find the correct starting page number for each real chapter in the [TOC LIST].\n"
-        "-----\n"
-        "### CRITICAL RULES FOR SUCCESS:\n"
-        "**1. Aggressively Ignore Noise:** The [JAVA HEADINGS LIST] is messy. You MUST completely ignore entries that are clearly not chapter titles. These include:\n"
-        "* **Single, common words:** Ignore entries like 'the', 'past', 'of', 'a', etc.\n"
-        "* **Symbols and Junk:** Ignore entries that are just symbols, punctuation, or malformed text (e.g., '*', '/', '[', ']').\n"
-        "* **Generic Capitalized Words:** Ignore standalone, capitalized words that are unlikely to be full chapter titles (e.g., 'LEVEL', 'FUTURE').\n"
-        "**2. Reconstruct Fragmented Titles:** This is the most important challenge. A chapter title like 'LSD PSYCHOTHERAPY' might be split in the noisy data like this:\n"
-        "{ 'title': 'LSD', 'pageNumber': 262 }\n"
-        "{ 'title': 'PSYCHOTHERAPY', 'pageNumber': 262 }\n"
-        "* **Your Strategy:** You must look for **consecutive entries** in the [JAVA HEADINGS LIST] that appear on the **same page number**.\n"
-        "* When you find such a sequence, combine their 'title' fields. If the combined text matches a chapter from the [TOC LIST], you have found a match.\n"
-        "* The correct page number for the chapter is the page number of the **first** entry in that sequence.\n"
-        "**3. Use Logical Reasoning to Resolve Ambiguity:**\n"
-        "* **Chronological Order is Mandatory:** Chapter page numbers MUST increase sequentially. Chapter 5 cannot start on a page that comes after Chapter 6. Use this to eliminate impossible matches.\n"
-        "* **Plausible Chapter Length:** If you are unsure between two possible page numbers for a chapter, consider the page numbers of the chapters before and after it. If one choice makes the chapter only one or two pages long while all other chapters are 20 pages long, it is almost certainly the wrong choice. Select the page number that results in a more logical and balanced book structure.\n"
-        "**4. Be Flexible with Minor Differences:** A chapter in the [TOC LIST] might be 'The Coming Storm', while the data has 'COMING STORM'. This is a valid match. Ignore differences in capitalization and minor words like 'The', 'A', or 'An'.\n"
-        "**5. Extra hints:  'level': 1: This means the heading's font size is 2 points or more larger than the average. This is a strong signal that the text is a primary heading, like a chapter title. The 'level': 0: This means the font size is less than 2 points larger than the average, so it's less likely to be a header. Best to see if you can match everything with level 1, and only then start looking at level 0 if needed.\n"
-        "-----\n"
-        "### YOUR INPUTS:\n"
-        "**[TOC LIST]**\n"
-        + json.dumps(formatted_toc_for_prompt, indent=2) +
-        "\n**[JAVA HEADINGS LIST]**\n"
-        + json.dumps(java_headings, indent=2) +
-        "\n-----\n"
-        "### YOUR TASK:\n"
-        "Now, analyze the two lists according to the critical rules above.\n"
-        "Your output response should be ALWAYS return in JSON format, never anything else. Return only valid JSON in your reply with no Markdown, code blocks, comments, or explanations; the response must be a single JSON object that exactly matches the required keys and structure I provide, with no extra characters or formatting, and if you cannot comply output an empty JSON object {} instead.\n"
-        "JSON format: \n[\n    {\"title\": \"LEVEL\",\"pageNumber\": 253,\"level\": 1},\n    {\"title\": \"the\",\"pageNumber\": 256,\"level\": 1},\n    {\"title\": \"Edgar\",\"pageNumber\": 256,\"level\": 1},\n    {\"title\": \"past\",\"pageNumber\": 256,\"level\": 1},\n    {\"title\": \"FUTURE\",\"pageNumber\": 262,\"level\": 1},\n    {\"title\": \"*\",\"pageNumber\": 262,\"level\": 1},\n    {\"title\": \"LSD\",\"pageNumber\": 262,\"level\": 1},\n    {\"title\": \"PSYCHOTHERAPY\",\"pageNumber\": 262,\"level\": 1}\n]"
-    )
-    headers = {"Content-Type": "application/json"}
+    LOG.debug("Formatted TOC for final prompt (should NOT include page_number): %s", formatted_toc_for_prompt)
+
+    # Compact JSON: indentation only costs prompt tokens
+    toc_json = orjson.dumps(formatted_toc_for_prompt).decode()
+    java_json = orjson.dumps(java_headings).decode()
+    prompt = f"{_MATCH_PROMPT_HEAD_A}{book_title}{_MATCH_PROMPT_HEAD_B}{toc_json}{_MATCH_PROMPT_MID}{java_json}{_MATCH_PROMPT_TAIL}"
+    # The key goes in a header so it never appears in logged request URLs
+    headers = {"Content-Type": "application/json", "x-goog-api-key": GEMINI_API_KEY}
     data = {"contents": [{"parts": [{"text": prompt}]}]}
     try:
-        response = requests.post(url, headers=headers, json=data)
-        print("[DEBUG] Gemini match API status:", response.status_code)
+        response = await ASYNC_HTTP.post(url, headers=headers, content=orjson.dumps(data))
+        LOG.debug("Gemini match API status: %s", response.status_code)
         if response.status_code == 200:
-            result = response.json()
-            print("[DEBUG] Gemini match raw response:", result)
+            result = orjson.loads(response.content)
+            LOG.debug("Gemini match raw response: %s", result)
             candidates = result.get("candidates", [])
             if candidates:
                 text_response = candidates[0]["content"]["parts"][0]["text"]
                 # Strip triple backticks and 'json' if present
-                cleaned = text_response.strip()
-                if cleaned.startswith('```json'):
-                    cleaned = cleaned[len('```json'):].strip()
-                if cleaned.startswith('```'):
-                    cleaned = cleaned[len('```'):].strip()
-                if cleaned.endswith('```'):
-                    cleaned = cleaned[:-3].strip()
+                cleaned = _FENCE_RE.match(text_response).group(1)
                 try:
-                    final_chapters = json.loads(cleaned)
+                    final_chapters = orjson.loads(cleaned)
                     if isinstance(final_chapters, list) and final_chapters:
                         return final_chapters
                 except Exception:
-                    print("[DEBUG] Gemini match response not valid JSON:", cleaned)
+                    LOG.warning("Gemini match response not valid JSON: %s", cleaned)
                     # Try fallback parsing
                     final_chapters = parse_chapter_list(cleaned)
                     if final_chapters:
-                        print("[DEBUG] Parsed chapter list from markdown format.")
+                        LOG.debug("Parsed chapter list from markdown format.")
                         return final_chapters
                 # Fallback: return original TOC if Gemini output is empty or invalid
-                print("[DEBUG] Gemini output empty or invalid, returning original TOC.")
+                LOG.warning("Gemini output empty or invalid, returning original TOC.")
                 return toc
         return []
     except Exception as e:
-        print("[DEBUG] Gemini match API exception:", e)
+        LOG.error("Gemini match API exception: %s", e)
         return []
 
 
+def _json_response(content, headers=None):
+    """JSON response serialized with orjson (FastAPI's ORJSONResponse is deprecated)."""
+    return Response(orjson.dumps(content), media_type="application/json", headers=headers)
+
+
+async def _save_upload(file, digest=None):
+    """
+    Stream an upload to a temporary .pdf file in 1 MiB chunks and return its path,
+    so the whole PDF is never buffered in memory or written from the event loop.
+    If `digest` (a hashlib object) is given, it is fed every chunk on the way.
+    """
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+        tmp_path = tmp.name
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            while chunk := await file.read(1 << 20):
+                if digest is not None:
+                    digest.update(chunk)
+                await f.write(chunk)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+
 @app.post("/extract-toc")
 async def extract_toc_endpoint(file: UploadFile = File(...)):
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
+        tmp_path = await _save_upload(file)
         # Call the new TOC extraction logic
         result = await get_toc_from_new_logic(tmp_path)
         toc = result["toc_entries"] if result and "toc_entries" in result else []
@@ -192,41 +288,79 @@ async def extract_toc_endpoint(file: UploadFile = File(...)):
             }
             for entry in toc
         ]
-        return JSONResponse(content={"toc": filtered_toc})
+        return _json_response({"toc": filtered_toc})
     except Exception as e:
-        return JSONResponse(content={"error": str(e)})
+        return _json_response({"error": str(e)})
     finally:
         # Clean up the temporary file
         if 'tmp_path' in locals() and os.path.exists(tmp_path):
             os.unlink(tmp_path)
 
 
+async def _run_full_pipeline(tmp_path):
+    """
+    Shared pipeline for /match-toc-java and /process-pdf: image-based TOC
+    extraction, Java headings, then the Gemini matching step. Returns the
+    response dict and whether it is complete enough to cache.
+    """
+    # TOC extraction and the Java headings call are independent; run them together
+    result, java_headings = await asyncio.gather(
+        get_toc_from_new_logic(tmp_path),
+        _java_async(tmp_path),
+        return_exceptions=True
+    )
+    if isinstance(result, Exception):
+        LOG.error("TOC extraction failed: %s", result)
+        result = None
+    if isinstance(java_headings, Exception):
+        LOG.warning("Java headings API exception: %s", java_headings)
+        java_headings = {"error": str(java_headings)}
+    toc = result["toc_entries"] if result and "toc_entries" in result else []
+    metadata = result["metadata"] if result and "metadata" in result else {}
+    book_title = metadata.get("book_title") or "Unknown Title"
+    authors = metadata.get("authors") or ["Unknown Author"]
+    LOG.debug("Java headings for matching: %s", java_headings)
+    final_chapters = await match_toc_with_java_headings_gemini(toc, java_headings, book_title) if GEMINI_API_KEY else []
+    # Degraded results are not worth caching: Java failed (error dict, or [] for a
+    # non-200 reply), or Gemini's reply was unusable and the unmatched TOC came back
+    complete = isinstance(java_headings, list) and bool(java_headings) and final_chapters is not toc
+    return {
+        "book_title": book_title,
+        "authors": authors,
+        "toc": final_chapters
+    }, complete
+
+
+async def _run_cached_pipeline(tmp_path, pdf_sha256):
+    """
+    Run the full pipeline, keyed by the SHA256 of the uploaded PDF so repeated
+    uploads skip both the Gemini calls and the Java round-trip.
+    """
+    key = "pipeline:" + pdf_sha256
+    cached = await llm_cache.backend.get(key)
+    if cached is not None:
+        pipeline_stats["hits"] += 1
+        LOG.info("Pipeline cache hit: %s", key)
+        return _json_response(cached, headers={"X-Cache": "HIT"})
+    pipeline_stats["misses"] += 1
+    final_json, complete = await _run_full_pipeline(tmp_path)
+    LOG.debug("Final API response: %s", final_json)
+    # Only cache successful runs so transient failures are retried next time
+    if final_json["toc"] and complete:
+        await llm_cache.backend.set(key, final_json, ttl=PIPELINE_CACHE_TTL)
+    return _json_response(final_json, headers={"X-Cache": "MISS"})
+
+
 @app.post("/match-toc-java")
 async def match_toc_java_endpoint(
     file: UploadFile = File(...)
 ):
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
-        # Call the new TOC extraction logic
-        result = await get_toc_from_new_logic(tmp_path)
-        toc = result["toc_entries"] if result and "toc_entries" in result else []
-        metadata = result["metadata"] if result and "metadata" in result else {}
-        book_title = metadata.get("book_title") or "Unknown Title"
-        authors = metadata.get("authors") or ["Unknown Author"]
-        java_headings = get_java_headings(tmp_path)
-        print("[DEBUG] Java headings for matching:", java_headings)
-        final_chapters = match_toc_with_java_headings_gemini(toc, java_headings, book_title) if GEMINI_API_KEY else []
-        final_json = {
-            "book_title": book_title,
-            "authors": authors,
-            "toc": final_chapters
-        }
-        print("[DEBUG] Final API response:", final_json)
-        return JSONResponse(content=final_json)
+        digest = hashlib.sha256()
+        tmp_path = await _save_upload(file, digest)
+        return await _run_cached_pipeline(tmp_path, digest.hexdigest())
     except Exception as e:
-        return JSONResponse(content={"error": str(e)})
+        return _json_response({"error": str(e)})
     finally:
         if 'tmp_path' in locals() and os.path.exists(tmp_path):
             os.unlink(tmp_path)
@@ -237,27 +371,19 @@ async def process_pdf(
     file: UploadFile = File(...)
 ):
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
-        # Call the new TOC extraction logic
-        result = await get_toc_from_new_logic(tmp_path)
-        toc = result["toc_entries"] if result and "toc_entries" in result else []
-        metadata = result["metadata"] if result and "metadata" in result else {}
-        book_title = metadata.get("book_title") or "Unknown Title"
-        authors = metadata.get("authors") or ["Unknown Author"]
-        java_headings = get_java_headings(tmp_path)
-        print("[DEBUG] Java headings for matching:", java_headings)
-        final_chapters = match_toc_with_java_headings_gemini(toc, java_headings, book_title) if GEMINI_API_KEY else []
-        final_json = {
-            "book_title": book_title,
-            "authors": authors,
-            "toc": final_chapters
-        }
-        print("[DEBUG] Final API response:", final_json)
-        return JSONResponse(content=final_json)
+        digest = hashlib.sha256()
+        tmp_path = await _save_upload(file, digest)
+        return await _run_cached_pipeline(tmp_path, digest.hexdigest())
     except Exception as e:
-        return JSONResponse(content={"error": str(e)})
+        return _json_response({"error": str(e)})
     finally:
         if 'tmp_path' in locals() and os.path.exists(tmp_path):
-            os.unlink(tmp_path)
\ No newline at end of file
+            os.unlink(tmp_path)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return _json_response({
+        "pipeline_cache": pipeline_stats,
+        "gemini_image_cache": toc_logic.stats
+    })
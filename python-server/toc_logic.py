@@ -1,29 +1,45 @@
 import sys
 import os
+import logging
 import asyncio
-import json
+import orjson
+import hashlib
+import functools
+import tempfile
+from collections import defaultdict
+from operator import itemgetter
 from pathlib import Path
-from PIL import Image
+from PIL import Image, ImageStat
 from typing import Optional, List
 
+import llm_cache
+
+# No-op when imported by main.py, which configures logging first
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+LOG = logging.getLogger("toc")
+
 # --- Library Check ---
 try:
     import google.generativeai as genai
     from pydantic import BaseModel
+    from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
     # pdf2image is optional when PyMuPDF fallback is available
     try:
-        from pdf2image import convert_from_path
+        from pdf2image import convert_from_path, pdfinfo_from_path
     except Exception:
-        convert_from_path = None
+        convert_from_path = pdfinfo_from_path = None
     # Try optional PyMuPDF fallback
     try:
         import fitz  # PyMuPDF
     except Exception:
         fitz = None
 
-    print("✅ Pre-flight check passed. Core libraries imported (pdf2image/fitz availability may vary).")
+    LOG.info("✅ Pre-flight check passed. Core libraries imported (pdf2image/fitz availability may vary).")
 except ImportError as e:
-    print(f"\n--- ❌ CRITICAL ERROR: A required library failed to import: {e} ---")
+    LOG.critical("--- ❌ CRITICAL ERROR: A required library failed to import: %s ---", e)
     sys.exit()
 
 # --- API Configuration ---
@@ -33,12 +49,25 @@ API_KEY = os.environ.get("GEMINI_API_KEY", "") # Fallback to empty string if not
 if API_KEY:
     try:
         genai.configure(api_key=API_KEY)
-        print("API Key configured successfully.")
+        LOG.info("API Key configured successfully.")
     except Exception as e:
-        print(f"An error occurred during API configuration: {e}")
+        LOG.error("An error occurred during API configuration: %s", e)
         API_KEY = None
 else:
-    print("GEMINI_API_KEY environment variable not set.")
+    LOG.warning("GEMINI_API_KEY environment variable not set.")
+
+# --- Pipeline Configuration ---
+# Send all rendered pages to the Pro model in one call instead of discovery + verification
+TOC_SINGLE_PASS = os.environ.get("TOC_SINGLE_PASS", "").lower() in ("1", "true", "yes")
+# PDFs with more pages than this still use the two-pass path
+TOC_SINGLE_PASS_MAX_PAGES = int(os.environ.get("TOC_SINGLE_PASS_MAX_PAGES", "20"))
+# How long (seconds) cached Gemini responses for identical pages are reused
+GEMINI_CACHE_TTL = int(os.environ.get("GEMINI_CACHE_TTL", "86400"))
+# Page rendering: grayscale at this DPI/JPEG quality is plenty for legible TOC text
+TOC_RENDER_DPI = int(os.environ.get("TOC_RENDER_DPI", "100"))
+TOC_JPEG_Q = int(os.environ.get("TOC_JPEG_Q", "70"))
+# Pages whose pixel variance is below this are treated as blank and not sent
+TOC_BLANK_VARIANCE = float(os.environ.get("TOC_BLANK_VARIANCE", "10"))
 
 # --- Pydantic Data Models ---
 
@@ -58,17 +87,23 @@ class ExtractionResult(BaseModel):
     metadata: BookMetadata
     toc_entries: List[TocEntry]
 
-# --- Core Logic ---
+MAX_METADATA_FIELDS = len(BookMetadata.model_fields)
 
-async def get_structured_data_from_images(model, image_paths: List[str]):
-    """
-    Analyzes a list of image paths using the provided Gemini model and returns structured
-    JSON data containing metadata and TOC entries.
-    """
-    print(f"Processing a chunk of {len(image_paths)} images with model: {model.model_name}...")
+# Constant for every Gemini image call, so built once
+GENERATION_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=ExtractionResult
+)
+
+@functools.cache
+def _get_model(model_name: str):
+    """Construct each GenerativeModel once per process instead of per request."""
+    return genai.GenerativeModel(model_name=model_name)
+
+# --- Core Logic ---
 
-    # Updated prompt without 'chapter_number'
-    structured_prompt = """
+# Updated prompt without 'chapter_number'
+STRUCTURED_PROMPT = """
 Analyze the following book pages to extract metadata and the main table of contents.
 Your response will be programmatically constrained to the JSON schema provided.
 
@@ -93,167 +128,277 @@ If no table of contents entries are found, "toc_entries" MUST be an empty list [
 IMPORTANT: Return ONLY valid JSON. Do NOT include any markdown, explanations, or extra text. The output must be a single valid JSON object and nothing else.
 """
 
-    prompt_parts = [structured_prompt]
-    for path in image_paths:
-        prompt_parts.append(Image.open(path))
-
-    generation_config = genai.GenerationConfig(
-        response_mime_type="application/json",
-        response_schema=ExtractionResult
-    )
+# Hit/miss counters for cached Gemini image calls (exposed via /metrics)
+stats = {"hits": 0, "misses": 0}
 
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            # Using asyncio.to_thread for the blocking SDK call
-            response = await asyncio.to_thread(
-                model.generate_content,
-                contents=prompt_parts,
-                generation_config=generation_config
-            )
-            return response.text
-        except Exception as e:
-            error_str = str(e)
-            print(f"API call attempt {attempt + 1} failed: {error_str}")
-            if "Deadline Exceeded" in error_str or "503" in error_str:
-                if attempt + 1 < max_retries:
-                    await asyncio.sleep(2 ** attempt) # Exponential backoff
-                else:
-                    return '{"error": "API call failed after multiple retries"}'
-            else:
-                return f'{{"error": "API call failed", "details": "{error_str}"}}'
-    return '{"error": "API call failed after all retries"}'
+def _image_cache_key(model_name: str, images: List[dict]) -> str:
+    digest = hashlib.sha256()
+    digest.update(model_name.encode())
+    digest.update(STRUCTURED_PROMPT.encode())
+    for image in images:
+        digest.update(image["data"])
+    return "gemini:" + digest.hexdigest()
 
-async def process_pdf(pdf_path: str):
+def cached_llm_call(func):
     """
-    Extracts TOC and metadata from a PDF using a two-pass approach.
-    Pass 1 (Discovery): Uses a fast model to find pages containing the TOC.
-    Pass 2 (Verification): Uses a powerful model on only the identified pages for accurate extraction.
+    Cache a Gemini image call by model, prompt and page content, so re-uploads of
+    the same PDF replay earlier responses instead of calling the API again.
     """
-    if not API_KEY:
-        print("Cannot proceed without a valid API Key.")
-        return None
+    @functools.wraps(func)
+    async def wrapper(model, images: List[dict]):
+        key = _image_cache_key(model.model_name, images)
+        cached = await llm_cache.backend.get(key)
+        if cached is not None:
+            stats["hits"] += 1
+            return cached
+        stats["misses"] += 1
+        result = await func(model, images)
+        # Never cache failures; they should be retried on the next request
+        if not result.startswith('{"error"'):
+            await llm_cache.backend.set(key, result, ttl=GEMINI_CACHE_TTL)
+        return result
+    return wrapper
+
+# Max concurrent Gemini SDK calls per model name, to avoid rate-limit pile-ups
+GEMINI_CONCURRENCY = int(os.environ.get("GEMINI_CONCURRENCY", "4"))
+_GEMINI_SEMAPHORES = defaultdict(lambda: asyncio.Semaphore(GEMINI_CONCURRENCY))
+
+def _is_transient_error(exc: BaseException) -> bool:
+    error_str = str(exc)
+    return "Deadline Exceeded" in error_str or "503" in error_str
+
+def _log_retry(retry_state):
+    LOG.warning("API call attempt %d failed: %s", retry_state.attempt_number, retry_state.outcome.exception())
+
+@cached_llm_call
+async def get_structured_data_from_images(model, images: List[dict]):
+    """
+    Analyzes a list of page images (JPEG blobs) using the provided Gemini model and returns
+    structured JSON data containing metadata and TOC entries.
+    """
+    LOG.info("Processing a chunk of %d images with model: %s...", len(images), model.model_name)
+
+    prompt_parts = [STRUCTURED_PROMPT, *images]
 
-    print("\nStep 1: Converting first 20 PDF pages to JPEG images...")
-    output_dir = Path("pages")
-    output_dir.mkdir(exist_ok=True)
-    # Clean up old images before conversion
-    for old_image in output_dir.glob("*.jpg"):
-        try:
-            old_image.unlink()
-        except Exception:
-            pass
-
-    # Helper: try pdf2image (pdftoppm) first, fallback to PyMuPDF (fitz)
-    def _render_with_pymupdf(pdf_path_local: str, out_dir: Path, max_pages: int = 20):
-        if fitz is None:
-            raise RuntimeError("PyMuPDF (fitz) is not available for fallback rendering")
-        doc = fitz.open(pdf_path_local)
-        rendered = []
-        for page_index in range(min(max_pages, doc.page_count)):
-            page = doc.load_page(page_index)
-            pix = page.get_pixmap(dpi=150)
-            out_path = out_dir / f"page_{page_index+1:03d}.jpg"
-            pix.save(str(out_path))
-            rendered.append(str(out_path))
-        return rendered
-
-    image_paths = []
-    # Prefer pdf2image if convert_from_path is available and pdftoppm is on PATH
-    import shutil
-    use_pdf2image = convert_from_path is not None and shutil.which("pdftoppm")
     try:
-        if use_pdf2image:
-            images = convert_from_path(pdf_path, last_page=20, fmt='jpeg', output_folder=output_dir, output_file="page_")
-            image_paths = sorted([str(p) for p in output_dir.glob("*.jpg")])
-            print(f"Successfully converted {len(image_paths)} pages using pdf2image/pdftoppm.")
-        else:
-            # Attempt PyMuPDF fallback
-            print("pdftoppm not available: attempting PyMuPDF fallback (if installed)...")
-            image_paths = _render_with_pymupdf(pdf_path, output_dir, max_pages=20)
-            print(f"Successfully rendered {len(image_paths)} pages using PyMuPDF fallback.")
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(3),
+            wait=wait_exponential_jitter(max=8),
+            retry=retry_if_exception(_is_transient_error),
+            before_sleep=_log_retry,
+            reraise=True
+        ):
+            with attempt:
+                # Cap in-flight calls per model; the slot is released during backoff
+                async with _GEMINI_SEMAPHORES[model.model_name]:
+                    # Using asyncio.to_thread for the blocking SDK call
+                    response = await asyncio.to_thread(
+                        model.generate_content,
+                        contents=prompt_parts,
+                        generation_config=GENERATION_CONFIG
+                    )
+        return response.text
     except Exception as e:
-        print(f"[ERROR] Failed to convert/render PDF pages to images: {e}")
-        if not use_pdf2image:
-            print("[HINT] Install PyMuPDF with: python -m pip install pymupdf or install Poppler and ensure pdftoppm is on PATH.")
-        else:
-            print("[HINT] Is poppler installed and its `bin` folder added to PATH? See https://github.com/Belval/pdf2image#installing-poppler-on-windows")
+        error_str = str(e)
+        LOG.error("API call failed: %s", error_str)
+        if _is_transient_error(e):
+            return '{"error": "API call failed after multiple retries"}'
+        return f'{{"error": "API call failed", "details": "{error_str}"}}'
+
+def _jpeg_part(data: bytes) -> dict:
+    # Passed to Gemini as-is. PIL images would be re-encoded by the SDK as lossless
+    # WebP, throwing away the JPEG compression chosen here.
+    return {"mime_type": "image/jpeg", "data": data}
+
+def _is_blank(image: Image.Image) -> bool:
+    return ImageStat.Stat(image).var[0] < TOC_BLANK_VARIANCE
+
+def _render_one(page) -> Optional[dict]:
+    """Render a single page to an in-memory grayscale JPEG, or None for a blank page."""
+    pix = page.get_pixmap(dpi=TOC_RENDER_DPI, colorspace=fitz.csGRAY)
+    if _is_blank(Image.frombytes("L", (pix.width, pix.height), pix.samples)):
         return None
+    return _jpeg_part(pix.tobytes("jpeg", jpg_quality=TOC_JPEG_Q))
+
+def _render_pages(pdf_path: str, max_pages: int) -> List[dict]:
+    with fitz.open(pdf_path) as doc:
+        pages = (_render_one(doc.load_page(i)) for i in range(min(max_pages, doc.page_count)))
+        return [page for page in pages if page is not None]
+
+def _read_page_file(path: str) -> Optional[dict]:
+    """Load a JPEG written by pdftoppm, or None for a blank page."""
+    with Image.open(path) as image:
+        # Draft mode decodes the JPEG at 1/8 scale, plenty to spot a blank page
+        image.draft("L", (image.width // 8, image.height // 8))
+        if _is_blank(image):
+            return None
+    return _jpeg_part(Path(path).read_bytes())
+
+async def _render_with_pymupdf(pdf_path: str, max_pages: int = 20) -> List[dict]:
+    """
+    Fallback renderer used when pdftoppm is unavailable. PyMuPDF holds the GIL and
+    does not support multithreading, so pages are rendered in one serial pass over a
+    single open document, on a worker thread to keep the event loop free.
+    """
+    if fitz is None:
+        raise RuntimeError("PyMuPDF (fitz) is not available for fallback rendering")
+    return await asyncio.to_thread(_render_pages, pdf_path, max_pages)
 
-    # --- Pass 1: Discovery Pass with Flash Model ---
-    print("\n--- Starting Pass 1: Discovery (using gemini-2.5-flash) ---")
-    model_flash = genai.GenerativeModel(model_name="gemini-2.5-flash")
+def _pdf_page_count(pdf_path: str) -> Optional[int]:
+    """Total pages in the PDF (not just the rendered ones), or None if it cannot be read."""
+    try:
+        if fitz is not None:
+            with fitz.open(pdf_path) as doc:
+                return doc.page_count
+        if pdfinfo_from_path is not None:
+            return int(pdfinfo_from_path(pdf_path)["Pages"])
+    except Exception as e:
+        LOG.warning("Could not read the PDF page count: %s", e)
+    return None
+
+async def _discover_toc_pages(images: List[dict]):
+    """
+    Pass 1 (Discovery): runs the fast model over chunks of pages and returns the
+    indices of pages in chunks that produced TOC entries, plus every parsed result.
+    """
+    LOG.info("--- Starting Pass 1: Discovery (using gemini-2.5-flash) ---")
+    model_flash = _get_model("gemini-2.5-flash")
     chunk_size = 5
     discovery_tasks = []
-    for i in range(0, len(image_paths), chunk_size):
-        chunk_paths = image_paths[i:i + chunk_size]
-        discovery_tasks.append(get_structured_data_from_images(model_flash, chunk_paths))
+    for i in range(0, len(images), chunk_size):
+        chunk_images = images[i:i + chunk_size]
+        discovery_tasks.append(get_structured_data_from_images(model_flash, chunk_images))
     discovery_results = await asyncio.gather(*discovery_tasks)
 
     toc_page_indices = set()
     all_parsed_results_pass1 = []
     for i, res_str in enumerate(discovery_results):
         try:
-            res_json = json.loads(res_str)
+            res_json = orjson.loads(res_str)
             all_parsed_results_pass1.append(res_json)
             if res_json.get("toc_entries"):
                 start_index = i * chunk_size
                 end_index = start_index + chunk_size
                 # Add all page indices from this successful chunk
-                for page_idx in range(start_index, min(end_index, len(image_paths))):
+                for page_idx in range(start_index, min(end_index, len(images))):
                     toc_page_indices.add(page_idx)
-        except (json.JSONDecodeError, TypeError):
-            print(f"Warning: Could not parse JSON from discovery chunk {i+1}.")
+        except (orjson.JSONDecodeError, TypeError):
+            LOG.warning("Could not parse JSON from discovery chunk %d.", i + 1)
             continue
+    return toc_page_indices, all_parsed_results_pass1
 
-    if not toc_page_indices:
-        print("\n--- Discovery Pass found no pages with TOC entries. Aborting. ---")
+async def process_pdf(pdf_path: str):
+    """
+    Extracts TOC and metadata from a PDF using a two-pass approach.
+    Pass 1 (Discovery): Uses a fast model to find pages containing the TOC.
+    Pass 2 (Verification): Uses a powerful model on only the identified pages for accurate extraction.
+    With TOC_SINGLE_PASS=1, short PDFs skip discovery and send every page to the powerful model once.
+    """
+    if not API_KEY:
+        LOG.error("Cannot proceed without a valid API Key.")
         return None
 
-    print(f"\n--- Discovery Pass identified {len(toc_page_indices)} potential TOC pages. ---")
+    LOG.info("Step 1: Converting first 20 PDF pages to JPEG images...")
+    images = []
+    # Prefer pdf2image if convert_from_path is available and pdftoppm is on PATH
+    import shutil
+    use_pdf2image = convert_from_path is not None and shutil.which("pdftoppm")
+    try:
+        if use_pdf2image:
+            # pdftoppm writes into a per-request scratch directory that is removed
+            # on exit, so concurrent requests never share or delete each other's pages.
+            with tempfile.TemporaryDirectory(prefix="toc_pages_") as output_dir:
+                # paths_only returns the page files in page order without opening them
+                page_files = await asyncio.to_thread(
+                    convert_from_path, pdf_path, last_page=20, dpi=TOC_RENDER_DPI, fmt='jpeg',
+                    grayscale=True, jpegopt={"quality": TOC_JPEG_Q}, output_folder=output_dir,
+                    paths_only=True
+                )
+                pages = await asyncio.to_thread(lambda: [_read_page_file(p) for p in page_files])
+                images = [page for page in pages if page is not None]
+            LOG.info("Successfully converted %d pages using pdf2image/pdftoppm.", len(images))
+        else:
+            # Attempt PyMuPDF fallback
+            LOG.info("pdftoppm not available: attempting PyMuPDF fallback (if installed)...")
+            images = await _render_with_pymupdf(pdf_path, max_pages=20)
+            LOG.info("Successfully rendered %d pages using PyMuPDF fallback.", len(images))
+    except Exception as e:
+        LOG.error("Failed to convert/render PDF pages to images: %s", e)
+        if not use_pdf2image:
+            LOG.error("[HINT] Install PyMuPDF with: python -m pip install pymupdf or install Poppler and ensure pdftoppm is on PATH.")
+        else:
+            LOG.error("[HINT] Is poppler installed and its `bin` folder added to PATH? See https://github.com/Belval/pdf2image#installing-poppler-on-windows")
+        return None
 
-    # --- Pass 2: Verification Pass with Pro Model ---
-    print("\n--- Starting Pass 2: Verification (using gemini-2.5-pro) ---")
-    model_pro = genai.GenerativeModel(model_name="gemini-2.5-pro")
-    # Create a list of image paths from the discovered indices
-    targeted_image_paths = [image_paths[i] for i in sorted(list(toc_page_indices))]
-    final_result_str = await get_structured_data_from_images(model_pro, targeted_image_paths)
+    model_pro = _get_model("gemini-2.5-pro")
+    single_pass = False
+    if TOC_SINGLE_PASS:
+        page_count = await asyncio.to_thread(_pdf_page_count, pdf_path)
+        single_pass = page_count is not None and page_count <= TOC_SINGLE_PASS_MAX_PAGES
+    if single_pass:
+        # --- Single Pass with Pro Model over all rendered pages ---
+        # One call instead of 4 discovery calls + 1 verification call.
+        LOG.info("--- Starting single-pass extraction (using gemini-2.5-pro) ---")
+        all_parsed_results_pass1 = []
+        final_result_str = await get_structured_data_from_images(model_pro, images)
+    else:
+        toc_page_indices, all_parsed_results_pass1 = await _discover_toc_pages(images)
+        if not toc_page_indices:
+            LOG.warning("--- Discovery Pass found no pages with TOC entries. Aborting. ---")
+            return None
+
+        LOG.info("--- Discovery Pass identified %d potential TOC pages. ---", len(toc_page_indices))
+
+        # --- Pass 2: Verification Pass with Pro Model ---
+        LOG.info("--- Starting Pass 2: Verification (using gemini-2.5-pro) ---")
+        # Select the page images from the discovered indices
+        targeted_images = [images[i] for i in sorted(toc_page_indices)]
+        final_result_str = await get_structured_data_from_images(model_pro, targeted_images)
 
     try:
-        final_data = json.loads(final_result_str)
-    except (json.JSONDecodeError, TypeError):
-        print("\n--- ❌ FINAL RESULT ---")
-        print("ERROR: Failed to parse the final JSON output from the Pro model.")
+        final_data = orjson.loads(final_result_str)
+    except (orjson.JSONDecodeError, TypeError):
+        LOG.error("--- ❌ FINAL RESULT --- Failed to parse the final JSON output from the Pro model.")
         return None
 
     # --- Final Consolidation ---
-    print("\n--- Consolidating final results ---")
+    LOG.info("--- Consolidating final results ---")
 
     # Although Pass 2 gives the definitive TOC, we can still pick the best metadata
-    # from the broader scan in Pass 1 for robustness.
+    # from the broader scan in Pass 1 for robustness. In single-pass mode the one
+    # result already covers every page.
     best_metadata = {}
     max_filled_fields = -1
-    for result in all_parsed_results_pass1:
-        metadata = result.get("metadata", {})
+    for result in all_parsed_results_pass1 or [final_data]:
+        metadata = result.get("metadata") or {}
         if metadata:
-            filled_count = sum(1 for value in metadata.values() if value is not None)
+            filled_count = sum(value is not None for value in metadata.values())
             if filled_count > max_filled_fields:
-                max_filled_fields = filled_count
-                best_metadata = metadata
+                max_filled_fields, best_metadata = filled_count, metadata
+                # Every field is filled; no later result can score higher
+                if filled_count == MAX_METADATA_FIELDS:
+                    break
 
     # Get the high-quality TOC from the Verification Pass
     final_combined_toc = final_data.get("toc_entries", [])
 
     # Relaxed: Accept all entries from LLM output, no deduplication or filtering
-    final_combined_toc.sort(key=lambda item: item.get('page_number', 0))
+    # The response schema makes page_number a required int, so the C-level
+    # itemgetter is safe; fall back to a tolerant key for malformed output.
+    try:
+        final_combined_toc.sort(key=itemgetter("page_number"))
+    except (KeyError, TypeError):
+        final_combined_toc.sort(key=lambda item: item.get("page_number") or 0)
 
     final_result_obj = {
         "metadata": best_metadata,
         "toc_entries": final_combined_toc
     }
 
-    print("\n\n--- ✅ SUCCESS: COMBINED & PROCESSED FINAL DATA ---")
-    print(json.dumps(final_result_obj, indent=2))
+    LOG.info("--- ✅ SUCCESS: COMBINED & PROCESSED FINAL DATA (%d TOC entries) ---", len(final_combined_toc))
+    # Skip serializing the multi-KB dump entirely unless DEBUG is on
+    if LOG.isEnabledFor(logging.DEBUG):
+        LOG.debug("%s", orjson.dumps(final_result_obj, option=orjson.OPT_INDENT_2).decode())
 
     return final_result_obj
 
@@ -14,60 +14,184 @@ Usage:
 Notes:
 - This script tries to be cross-platform but system package installation and JDK
     selection are only supported on Linux with apt/update-alternatives.
-- It will attempt to stop prior uvicorn processes on POSIX systems before starting
-    a new Python server (uses `pkill -f uvicorn` when available).
+- It stops the uvicorn server started by its previous run (tracked in
+    `python-server/.uvicorn.pid`) before starting a new Python server.
 """
 
 import argparse
+import asyncio
 import atexit
-import glob
+import hashlib
+import io
 import json
 import os
 import platform
+import re
+import select
 import shutil
 import signal
+import socket
 import subprocess
 import sys
+import threading
 import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
 except Exception:
     requests = None
 
+# Optional: async upload that overlaps with tailing the server log (installed with
+# python-server/requirements.txt); without httpx the stdlib urllib path is used
+try:
+    import httpx
+except Exception:
+    httpx = None
+
+try:
+    import aiofiles
+except Exception:
+    aiofiles = None
+
+try:
+    import uvloop
+except Exception:
+    uvloop = None
+
 ROOT = Path(__file__).resolve().parent
 PY_SERVER_DIR = ROOT / "python-server"
 VENV_DIR = PY_SERVER_DIR / ".venv"
 ENV_FILE = ROOT / ".env"
 JAVA_LOG = ROOT / "java.log"
 PY_LOG = PY_SERVER_DIR / "python.log"
+PY_PID_FILE = PY_SERVER_DIR / ".uvicorn.pid"
+CACHE_FILE = ROOT / ".run_local_cache.json"
+# KEY=VALUE lines of a .env file; surrounding whitespace and double quotes are dropped
+_ENV_RE = re.compile(r'(?m)^[ \t]*([A-Za-z_]\w*)[ \t]*=[ \t]*"?(.*?)"?[ \t\r]*$')
+
+# Keep-alive pool shared by the readiness probes
+SESSION = None
+if requests is not None:
+    SESSION = requests.Session()
+    SESSION.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0))
 
 processes = {}
+# Per-thread output buffer used by run_buffered
+_task_output = threading.local()
+_print_lock = threading.Lock()
+_cache_lock = threading.Lock()
+
+
+def _cache_load():
+    try:
+        return json.loads(CACHE_FILE.read_text())
+    except Exception:
+        return {}
+
+
+def _cache_get(key):
+    """Return a value stored by a previous run in .run_local_cache.json, or None."""
+    return _cache_load().get(key)
+
+
+def _cache_set(key, val):
+    with _cache_lock:
+        data = _cache_load()
+        data[key] = val
+        try:
+            CACHE_FILE.write_text(json.dumps(data, indent=2))
+        except OSError:
+            pass
+
+
+def which(name):
+    """shutil.which with the result cached across runs for the current PATH."""
+    key = "which:" + name + ":" + hashlib.md5(os.environ.get("PATH", "").encode()).hexdigest()
+    path = _cache_get(key)
+    if path and os.access(path, os.X_OK):
+        return path
+    path = shutil.which(name)
+    if path:
+        _cache_set(key, path)
+    return path
 
 
 def load_env(path: Path):
     """Load simple KEY=VALUE pairs from a .env file into os.environ."""
     if not path.exists():
         return 0
-    with path.open() as f:
-        for ln in f:
-            ln = ln.strip()
-            if not ln or ln.startswith("#"):
-                continue
-            if "=" not in ln:
-                continue
-            k, v = ln.split("=", 1)
-            k = k.strip()
-            v = v.strip().strip('"')
-            os.environ.setdefault(k, v)
+    # setdefault also makes the first occurrence of a repeated key win, as before
+    for k, v in _ENV_RE.findall(path.read_text()):
+        os.environ.setdefault(k, v)
     return 1
 
 
+class _TaskStdout:
+    """sys.stdout proxy that diverts writes from threads running a buffered task."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        buf = getattr(_task_output, "buf", None)
+        return (buf if buf is not None else self._stream).write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def run_buffered(fn, *args, **kwargs):
+    """Run fn, collecting its output and emitting it in one block when it finishes,
+    so tasks running in parallel threads do not interleave their logs."""
+    buf = io.StringIO()
+    _task_output.buf = buf
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _task_output.buf = None
+        with _print_lock:
+            sys.stdout.write(buf.getvalue())
+            sys.stdout.flush()
+
+
 def run_cmd(cmd, cwd=None, check=True, capture_output=False, env=None):
     """Run a command and return CompletedProcess. Prints the command."""
     print("\n$", " ".join(cmd))
-    return subprocess.run(cmd, cwd=cwd, check=check, capture_output=capture_output, env=env)
+    buf = getattr(_task_output, "buf", None)
+    if buf is None or capture_output:
+        return subprocess.run(cmd, cwd=cwd, check=check, capture_output=capture_output, env=env)
+    # Inside run_buffered: route the command's output into the task buffer too
+    proc = subprocess.run(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True, errors="replace", env=env)
+    buf.write(proc.stdout)
+    if check:
+        proc.check_returncode()
+    return proc
+
+
+def _apt_is_fresh(max_age=24 * 60 * 60):
+    try:
+        return time.time() - os.stat("/var/cache/apt/pkgcache.bin").st_mtime < max_age
+    except OSError:
+        return False
+
+
+def _installed_debs():
+    """Names of packages dpkg reports as fully installed ("ii")."""
+    try:
+        out = subprocess.check_output(
+            ["dpkg-query", "-W", "-f=${db:Status-Abbrev} ${Package}\n"], stderr=subprocess.DEVNULL, text=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return set()
+    return {ln.split()[-1] for ln in out.splitlines() if ln.startswith("ii")}
 
 
 def try_system_installs():
@@ -93,9 +217,17 @@ def try_system_installs():
         "tesseract-ocr",
         "tesseract-ocr-eng",
     ]
+    installed = _installed_debs()
+    missing = [p for p in pkgs if p not in installed]
+    if not missing:
+        print("System packages already installed; skipping apt")
+        return
     try:
-        run_cmd(sudo + [apt, "update"])
-        run_cmd(sudo + [apt, "install", "-y"] + pkgs)
+        if _apt_is_fresh():
+            print("apt package lists updated within the last 24h; skipping apt update")
+        else:
+            run_cmd(sudo + [apt, "update"])
+        run_cmd(sudo + [apt, "install", "-y"] + missing)
     except Exception as e:
         print("System install attempted but failed:", e)
 
@@ -125,17 +257,25 @@ def create_venv_and_install_requirements(venv_override: str = None):
         return sys.executable
 
     print("Found requirements file:", reqs)
-    # Try to upgrade pip first (best-effort)
-    try:
-        print("Upgrading pip (best-effort)...")
-        run_cmd([sys.executable, "-m", "pip", "install", "--upgrade", "pip"])
-    except Exception as e:
-        print("Warning: failed to upgrade pip (continuing):", e)
-
-    # Install requirements
+    # No venv to stamp, so the hash of the last successful install is kept in the
+    # run cache, per interpreter
+    cur = hashlib.sha256(reqs.read_bytes()).hexdigest()
+    hash_key = "reqs:" + sys.executable
+    if _cache_get(hash_key) == cur:
+        print("Requirements unchanged since last install; skipping pip")
+        return sys.executable
+    # A single pip run. pip itself is not upgraded: `--upgrade pip -r ...` would
+    # also upgrade every (unpinned) requirement that is already satisfied.
+    env = dict(os.environ, PIP_NO_INPUT="1", PIP_DISABLE_PIP_VERSION_CHECK="1")
+    uv = shutil.which("uv")
+    if uv:
+        cmd = [uv, "pip", "install", "--python", sys.executable, "-r", str(reqs)]
+    else:
+        cmd = [sys.executable, "-m", "pip", "install", "-r", str(reqs)]
     try:
         print("Installing Python dependencies from:", reqs)
-        run_cmd([sys.executable, "-m", "pip", "install", "-r", str(reqs)])
+        run_cmd(cmd, env=env)
+        _cache_set(hash_key, cur)
     except Exception as e:
         print("Failed to install requirements:", e)
         print("You can install them manually with:")
@@ -147,16 +287,31 @@ def create_venv_and_install_requirements(venv_override: str = None):
 def find_jdk17():
     """Try to find a JDK 17 installation on common paths or via java -version."""
     # First try java -version parsing
-    java = shutil.which("java")
+    java = which("java")
     if java:
+        # The JVM probe costs a JVM start; reuse its verdict until PATH, JAVA_HOME
+        # or the java binary itself changes.
         try:
-            out = subprocess.run([java, "-version"], capture_output=True, text=True)
-            ver = out.stderr.splitlines()[0] if out.stderr else out.stdout.splitlines()[0]
-            # Example: 'openjdk version "17.0.1"'
-            if "17" in ver:
-                return java  # java executable is sufficient
-        except Exception:
-            pass
+            key = "jdk17:" + hashlib.md5("|".join([
+                os.environ.get("PATH", ""), os.environ.get("JAVA_HOME", ""),
+                java, str(os.stat(java).st_mtime)
+            ]).encode()).hexdigest()
+        except OSError:
+            key = None
+        is_17 = _cache_get(key) if key else None
+        if is_17 is None:
+            is_17 = False
+            try:
+                out = subprocess.run([java, "-version"], capture_output=True, text=True)
+                ver = out.stderr.splitlines()[0] if out.stderr else out.stdout.splitlines()[0]
+                # Example: 'openjdk version "17.0.1"'
+                is_17 = "17" in ver
+            except Exception:
+                key = None
+            if key:
+                _cache_set(key, is_17)
+        if is_17:
+            return java  # java executable is sufficient
     # Try common JDK install dirs
     candidates = [
         "/usr/lib/jvm/java-17-openjdk-amd64",
@@ -170,30 +325,63 @@ def find_jdk17():
     return None
 
 
+def _find_jar():
+    """Return the newest jar in target/, preferring the repackaged spring-boot jar (not .original).
+
+    Without `mvn clean`, jars from older project versions can be left in target/.
+    """
+    jars = [p for p in (ROOT / "target").glob("*.jar") if not p.name.endswith(".jar.original")]
+    return max(jars, key=lambda p: p.stat().st_mtime, default=None)
+
+
+def _src_mtimes():
+    """Newest mtime of the files and of the directories under src/ (and pom.xml).
+
+    A directory's mtime changes when an entry is added, removed or renamed, which
+    file mtimes alone cannot show.
+    """
+    src = ROOT / "src"
+    file_mtime = (ROOT / "pom.xml").stat().st_mtime
+    dir_mtime = src.stat().st_mtime
+    for p in src.rglob("*"):
+        st = p.stat()
+        if p.is_dir():
+            dir_mtime = max(dir_mtime, st.st_mtime)
+        else:
+            file_mtime = max(file_mtime, st.st_mtime)
+    return file_mtime, dir_mtime
+
+
 def build_java_if_needed(skip_java: bool):
     """Build the Java application with Maven unless skipped."""
     if skip_java:
         print("Skipping local Java build (flag set)")
         return None
-    mvn = shutil.which("mvn")
+    jar = _find_jar()
+    clean = True
+    if jar:
+        try:
+            jar_mtime = jar.stat().st_mtime
+            file_mtime, dir_mtime = _src_mtimes()
+        except OSError:
+            pass
+        else:
+            if jar_mtime >= max(file_mtime, dir_mtime):
+                print("Jar is newer than src/ and pom.xml; skipping Maven build:", jar)
+                return str(jar)
+            # Only edits since the last build: an incremental build is safe. A source
+            # added, deleted or renamed needs `clean` so no stale class stays in the jar.
+            clean = dir_mtime > jar_mtime
+    mvn = which("mvn")
     if not mvn:
         print("Maven not found on PATH; cannot build Java locally")
         return None
     jdk = find_jdk17()
     if not jdk:
         print("JDK 17 not found automatically; proceeding but build may fail")
-    # Run mvn -DskipTests clean package
-    run_cmd([mvn, "-DskipTests", "clean", "package"], cwd=ROOT)
-    # Find jar
-    jars = glob.glob(str(ROOT / "target" / "*.jar"))
-    # Prefer the repackaged spring-boot jar (not .original)
-    jar = None
-    for j in jars:
-        if j.endswith(".jar") and not j.endswith(".jar.original"):
-            jar = j
-            break
-    if not jar and jars:
-        jar = jars[0]
+    run_cmd([mvn, "-DskipTests"] + (["clean"] if clean else []) + ["package"], cwd=ROOT)
+    jar = _find_jar()
+    jar = str(jar) if jar else None
     if jar:
         print("Built jar:", jar)
     else:
@@ -201,12 +389,18 @@ def build_java_if_needed(skip_java: bool):
     return jar
 
 
+# Server children inherit only stdio (the log file is dup'ed onto stdout/stderr), and run
+# in their own session so a Ctrl-C in this script does not also signal them; they are
+# stopped explicitly via atexit / the pidfile instead. start_new_session is ignored on Windows.
+_SERVER_POPEN_KW = dict(close_fds=True, start_new_session=True)
+
+
 def start_java_server(jar_path: str):
     if not jar_path:
         return None
     f = open(JAVA_LOG, "a")
     print("Starting Java server (background):", jar_path)
-    p = subprocess.Popen(["java", "-jar", jar_path], stdout=f, stderr=subprocess.STDOUT)
+    p = subprocess.Popen(["java", "-jar", jar_path], stdout=f, stderr=subprocess.STDOUT, **_SERVER_POPEN_KW)
     processes['java'] = (p, f)
     print("Java PID:", p.pid)
     return p
@@ -229,19 +423,98 @@ def stop_java_server():
             pass
 
 
-def start_python_server(venv_python: str):
-    # Try to kill existing uvicorn on POSIX
-    if os.name != 'nt' and shutil.which('pkill'):
+def has_fast_event_loop(py: str) -> bool:
+    """Return True if `py` can import uvloop and httptools (not available on Windows)."""
+    try:
+        out = subprocess.run([py, "-c", "import uvloop, httptools"], capture_output=True)
+        return out.returncode == 0
+    except Exception:
+        return False
+
+
+def _wait_pid_exit(pid, timeout):
+    """Wait up to `timeout` seconds for `pid` to exit. Returns True if it did."""
+    if hasattr(os, "pidfd_open"):
         try:
-            subprocess.run(['pkill', '-f', 'uvicorn'], check=False)
-        except Exception:
+            pfd = os.pidfd_open(pid)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pfd = None
+        if pfd is not None:
+            try:
+                poller = select.poll()
+                poller.register(pfd, select.POLLIN)
+                return bool(poller.poll(int(timeout * 1000)))
+            finally:
+                os.close(pfd)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            return False
+        time.sleep(0.05)
+    return False
+
+
+def _is_our_uvicorn(pid):
+    """True if `pid` is still running `uvicorn main:app` (checked via /proc; False where unavailable)."""
+    try:
+        cmdline = Path(f"/proc/{pid}/cmdline").read_bytes().split(b"\0")
+    except OSError:
+        return False
+    return b"uvicorn" in cmdline and b"main:app" in cmdline
+
+
+def _remove_pid_file():
+    try:
+        PY_PID_FILE.unlink()
+    except OSError:
+        pass
+
+
+def stop_previous_python_server():
+    """Terminate the uvicorn server recorded by the previous run, if it is still alive."""
+    try:
+        pid = int(PY_PID_FILE.read_text().strip())
+    except (OSError, ValueError):
+        return
+    if not _is_our_uvicorn(pid):
+        # Stale file: the server is gone and the PID may have been reused
+        _remove_pid_file()
+        return
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except OSError:
+        pid = None
+    if pid and not _wait_pid_exit(pid, 3) and os.name != 'nt':
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
             pass
+    _remove_pid_file()
+
+
+def start_python_server(venv_python: str):
+    stop_previous_python_server()
     # Start uvicorn using venv python
     py = venv_python
     cmd = [py, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8000"]
+    if has_fast_event_loop(py):
+        cmd += ["--loop", "uvloop", "--http", "httptools"]
+    else:
+        print("uvloop/httptools not importable; uvicorn will use the default asyncio loop")
     f = open(PY_LOG, "a")
-    p = subprocess.Popen(cmd, cwd=str(PY_SERVER_DIR), stdout=f, stderr=subprocess.STDOUT, env=os.environ.copy())
+    p = subprocess.Popen(cmd, cwd=str(PY_SERVER_DIR), stdout=f, stderr=subprocess.STDOUT, env=os.environ.copy(),
+                         **_SERVER_POPEN_KW)
     processes['python'] = (p, f)
+    try:
+        PY_PID_FILE.write_text(str(p.pid))
+    except OSError:
+        pass
     print("Python PID:", p.pid)
     return p
 
@@ -257,45 +530,174 @@ def stop_python_server():
     except Exception:
         p.kill()
     finally:
+        _remove_pid_file()
         try:
             f.close()
         except Exception:
             pass
 
 
-def wait_for_url(url, timeout=30):
+def _http_ready(url):
+    try:
+        r = SESSION.get(url, timeout=3)
+        return r.status_code in (200, 302, 301, 401)
+    except Exception:
+        return False
+
+
+def _port_open(host, port, timeout=0.05):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        return s.connect_ex((host, port)) == 0
+
+
+def _pidfd(pid):
+    return os.pidfd_open(pid)
+
+
+def wait_for_url(url, timeout=30, proc=None):
+    """Wait until `url` answers. If `proc` is given, give up as soon as it exits."""
     if requests is None:
         print("requests library not available; cannot perform HTTP readiness checks")
         return False
-    start = time.time()
-    while time.time() - start < timeout:
+    pidfd = None
+    if proc is not None and hasattr(os, "pidfd_open") and hasattr(select, "epoll"):
         try:
-            r = requests.get(url, timeout=3)
-            if r.status_code in (200, 302, 301, 401):
-                return True
-        except Exception:
-            pass
-        time.sleep(1)
-    return False
+            pidfd = _pidfd(proc.pid)
+        except OSError:
+            pidfd = None
+    parts = urllib.parse.urlsplit(url)
+    host = parts.hostname or "127.0.0.1"
+    if host == "localhost":
+        host = "127.0.0.1"
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    if pidfd is None:
+        # No pidfd support (non-Linux or kernel < 5.3): poll the port cheaply and
+        # only confirm with an HTTP GET once something is listening
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if proc is not None and proc.poll() is not None:
+                print(f"Process {proc.pid} exited with code {proc.returncode} before {url} became ready")
+                return False
+            if _port_open(host, port):
+                if _http_ready(url):
+                    return True
+                time.sleep(0.5)
+            else:
+                time.sleep(0.05)
+        return False
+
+    ep = select.epoll()
+    try:
+        # The pidfd becomes readable when the child exits
+        ep.register(pidfd, select.EPOLLIN)
+        deadline = time.monotonic() + timeout
+        wait = 0.05
+        while time.monotonic() < deadline:
+            if ep.poll(wait):
+                print(f"Process {proc.pid} exited with code {proc.poll()} before {url} became ready")
+                return False
+            if _port_open(host, port):
+                if _http_ready(url):
+                    return True
+                # Listening but not serving yet; back off before the next HTTP probe
+                wait = 0.5
+        return False
+    finally:
+        ep.close()
+        os.close(pidfd)
+
+
+async def _tail_log(path: Path, poll=0.2):
+    """Echo error lines appended to `path` until cancelled."""
+    try:
+        f = path.open('r', encoding='utf-8', errors='replace')
+    except OSError:
+        return
+    with f:
+        f.seek(0, os.SEEK_END)
+        in_traceback = False
+        while True:
+            line = f.readline()
+            if not line:
+                await asyncio.sleep(poll)
+                continue
+            if line.startswith('Traceback'):
+                in_traceback = True
+            elif in_traceback and not line.startswith((' ', '\t')):
+                # The exception line closes the traceback
+                print('[python-server]', line.rstrip())
+                in_traceback = False
+                continue
+            if in_traceback or 'ERROR' in line:
+                print('[python-server]', line.rstrip())
+
+
+async def _post_pdf_async(pdf_path: Path, out_file: Path):
+    async with httpx.AsyncClient(timeout=300) as client:
+        with pdf_path.open('rb') as fh:
+            files = {'file': (pdf_path.name, fh, 'application/pdf')}
+            async with client.stream('POST', 'http://localhost:8000/process-pdf', files=files) as r:
+                if r.is_error:
+                    body = await r.aread()
+                    print('Request failed:', r.status_code, body[:1000].decode('utf-8', 'replace'))
+                r.raise_for_status()
+                if aiofiles is not None:
+                    async with aiofiles.open(out_file, 'wb') as o:
+                        async for chunk in r.aiter_bytes(65536):
+                            await o.write(chunk)
+                else:
+                    with out_file.open('wb') as o:
+                        async for chunk in r.aiter_bytes(65536):
+                            o.write(chunk)
+
+
+async def _post_pdf_with_log_tail(pdf_path: Path, out_file: Path):
+    # Surface server-side errors while the request is in flight rather than after
+    # the upload finishes or times out
+    tail = asyncio.create_task(_tail_log(PY_LOG))
+    try:
+        await _post_pdf_async(pdf_path, out_file)
+    finally:
+        tail.cancel()
+        await asyncio.gather(tail, return_exceptions=True)
+
+
+def _post_pdf_urllib(pdf_path: Path, out_file: Path):
+    """Stdlib-only upload: the multipart body is streamed from disk in 64 KiB chunks."""
+    boundary = uuid.uuid4().hex
+    filename = pdf_path.name.replace('"', '%22')
+    head = (f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            'Content-Type: application/pdf\r\n\r\n').encode('utf-8')
+    tail = f'\r\n--{boundary}--\r\n'.encode('ascii')
+
+    def body():
+        yield head
+        with pdf_path.open('rb') as fh:
+            for chunk in iter(lambda: fh.read(65536), b''):
+                yield chunk
+        yield tail
+
+    req = urllib.request.Request(
+        'http://localhost:8000/process-pdf', data=body(), method='POST',
+        headers={'Content-Type': f'multipart/form-data; boundary={boundary}',
+                 'Content-Length': str(len(head) + pdf_path.stat().st_size + len(tail))})
+    try:
+        with urllib.request.urlopen(req, timeout=300) as r, out_file.open('wb') as o:
+            shutil.copyfileobj(r, o, 65536)
+    except urllib.error.HTTPError as e:
+        print('Request failed:', e.code, e.read(1000).decode('utf-8', 'replace'))
+        raise
 
 
 def post_pdf_and_save(pdf_path: Path, out_file: Path):
-    if requests is None:
-        print("requests not installed in this Python. Attempting to use curl subprocess as fallback.")
-        curl = shutil.which('curl')
-        if not curl:
-            raise RuntimeError('requests not available and curl not found; cannot post PDF')
-        subprocess.check_call([curl, '-s', '-o', str(out_file), '-F', f'file=@{str(pdf_path)}', 'http://localhost:8000/process-pdf'])
+    if httpx is None:
+        print("httpx not installed in this Python; posting with urllib.request instead.")
+        _post_pdf_urllib(pdf_path, out_file)
         return
-    with pdf_path.open('rb') as fh:
-        files = {'file': fh}
-        r = requests.post('http://localhost:8000/process-pdf', files=files, timeout=300)
-        try:
-            r.raise_for_status()
-        except Exception:
-            print('Request failed:', r.status_code, r.text[:1000])
-            raise
-        out_file.write_text(r.text)
+    run = uvloop.run if uvloop is not None and hasattr(uvloop, 'run') else asyncio.run
+    run(_post_pdf_with_log_tail(pdf_path, out_file))
 
 
 def main():
@@ -326,13 +728,21 @@ def main():
     # Try system installs if on linux
     try_system_installs()
 
-    # Use the current Python environment; virtualenv creation/management is disabled.
-    venv_python = create_venv_and_install_requirements(venv_override=args.venv_path)
-
-    # Build Java if needed
+    # Installing requirements (current Python environment; virtualenv creation/management
+    # is disabled) and the Maven build are independent subprocess work, so run them
+    # side by side. Each task's output is printed as one block when it finishes.
     jar = None
-    if not skip_java:
-        jar = build_java_if_needed(skip_java=skip_java)
+    print('Installing Python requirements' + ('' if skip_java else ' and building Java') + ' in parallel...')
+    sys.stdout = _TaskStdout(sys.stdout)
+    try:
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            f_py = ex.submit(run_buffered, create_venv_and_install_requirements, venv_override=args.venv_path)
+            f_jar = None if skip_java else ex.submit(run_buffered, build_java_if_needed, skip_java)
+            venv_python = f_py.result()
+            if f_jar is not None:
+                jar = f_jar.result()
+    finally:
+        sys.stdout = sys.stdout._stream
 
     # Start Java server if jar present
     java_proc = None
@@ -350,14 +760,17 @@ def main():
     # Start Python server
     py_proc = start_python_server(venv_python)
 
-    # Wait for readiness
+    # Wait for readiness; both servers boot at the same time, so wait on them together
     print('Waiting for Java (port 8080) and Python (port 8000) to be available...')
-    java_ok = True
-    if jar and not skip_java:
-        java_ok = wait_for_url('http://localhost:8080/actuator/health', timeout=30)
-        if not java_ok:
-            print('Warning: Java server may not have /actuator/health or failed to start in time')
-    py_ok = wait_for_url('http://localhost:8000/docs', timeout=30)
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f_j = None
+        if java_proc is not None:
+            f_j = ex.submit(wait_for_url, 'http://localhost:8080/actuator/health', 60, java_proc)
+        f_p = ex.submit(wait_for_url, 'http://localhost:8000/docs', 60, py_proc)
+        java_ok = f_j.result() if f_j is not None else True
+        py_ok = f_p.result()
+    if not java_ok:
+        print('Warning: Java server may not have /actuator/health or failed to start in time')
     if not py_ok:
         print('Warning: Python server /docs not reachable within timeout. Check python-server/python.log')
 
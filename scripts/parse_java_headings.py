@@ -1,81 +1,114 @@
 import re
+import sys
 import json
+import mmap
 from pathlib import Path
 
+# Markers we observed in the logs, as one alternation so the log is scanned once.
+# (The old greedy fallbacks could only match where this already does.)
+# A bytes pattern, so it runs directly over the memory-mapped log.
+PAT = re.compile(rb"Java headings (?:raw response|for matching): (\[.*?\])", re.DOTALL)
+
+# One token per brace or key/value pair: Java map style (title=LSD, values stop at
+# the next comma or brace) or JSON style ("title": "LSD", the value is a JSON literal)
+TOKEN = re.compile(
+    r"\b(title|pageNumber|page|level)=([^,}]+)"
+    r'|"(title|pageNumber|page|level)"\s*:\s*("(?:[^"\\]|\\.)*"|[^,}\s]+)'
+    r"|([{}])"
+)
+
+# The log is appended to on every run, so the latest headings block sits near the
+# end: read backwards in 64 KiB chunks and only map the whole file if it is not there.
+MARKER = b"Java headings "
+TAIL_CHUNK = 64 * 1024
+TAIL_LIMIT = 8 * 1024 * 1024
+
+
+def last_match(buf):
+    m = None
+    for m in PAT.finditer(buf):
+        pass
+    return m
+
+
+def tail_block(path):
+    """Return (block, scanned_whole_file) for the last headings block in the log tail."""
+    chunks = []
+    with path.open("rb") as f:
+        pos = f.seek(0, 2)
+        read_total = 0
+        while pos > 0 and read_total < TAIL_LIMIT:
+            read = min(TAIL_CHUNK, pos)
+            pos -= read
+            f.seek(pos)
+            chunk = f.read(read)
+            read_total += read
+            # Include the head of the previous chunk so a marker split across reads is seen
+            seam = chunks[0][:len(MARKER) - 1] if chunks else b""
+            chunks.insert(0, chunk)
+            if MARKER in chunk + seam:
+                buf = b"".join(chunks)
+                m = last_match(buf)
+                if m:
+                    return buf[m.start(1):m.end(1)], pos == 0
+    return None, pos == 0
+
+
 log_path = Path("java.log")
 if not log_path.exists():
     print("java.log not found")
     raise SystemExit(1)
 
-log = log_path.read_text(encoding="utf-8", errors="replace")
-
-# Try several markers we observed in the logs
-patterns = [r"Java headings raw response: (\[.*?\])",
-            r"Java headings for matching: (\[.*?\])",
-            r"Java headings raw response: (\[.*\])",
-            r"Java headings for matching: (\[.*\])"]
 block = None
-for pat in patterns:
-    m = re.search(pat, log, flags=re.DOTALL)
-    if m:
-        block = m.group(1)
-        break
+if log_path.stat().st_size:
+    raw, scanned_all = tail_block(log_path)
+    if raw is None and not scanned_all:
+        # Map the log instead of reading it into a str; only the matched block is decoded
+        with log_path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            m = last_match(mm)
+            if m:
+                raw = mm[m.start(1):m.end(1)]
+    if raw is not None:
+        block = raw.decode("utf-8", "replace")
 
 if not block:
     print("No Java headings block found in java.log")
     raise SystemExit(1)
 
-s = block
-
-# Normalize Java map-style entries to JSON-like list of objects
-# Replace title=VALUE with "title": "VALUE"
-# Replace pageNumber=NUM with "pageNumber": NUM etc.
-
-# Ensure braces are JSON-friendly
-s = s.replace("\n", " ")
-# Quote title values (heuristic): title=... (stops at , pageNumber or , level or })
-s = re.sub(r"title=([^,\}]+)(?=,\s*pageNumber|,\s*level|\})",
-           lambda mo: '"title": ' + json.dumps(mo.group(1).strip()), s)
-# numbers
-s = re.sub(r"pageNumber=([0-9]+)", r'"pageNumber": \1', s)
-s = re.sub(r"level=([0-9]+)", r'"level": \1', s)
-# Ensure keys are quoted
-s = re.sub(r"\b(title|pageNumber|level)\s*:", r'"\1":', s)
-
-# Try to parse
-try:
-    parsed = json.loads(s)
-except Exception:
-    # Fallback: extract each {...} entry and parse manually
-    entries = re.findall(r"\{([^}]+)\}", s)
-    parsed = []
-    for ent in entries:
+# Java map-style entries, e.g. {title=LSD, pageNumber=262, level=1}, and JSON
+# objects are turned into dicts in a single tokenizer pass over the block.
+parsed = []
+obj = None
+for tok in TOKEN.finditer(block):
+    map_key, map_value, json_key, json_value, brace = tok.groups()
+    if brace == "{":
         obj = {}
-        parts = re.split(r",\s*(?=(?:[^\"]*\"[^\"]*\")*[^\"]*$)", ent)
-        for part in parts:
-            if ':' not in part:
-                continue
-            k, v = part.split(':', 1)
-            k = k.strip().strip('"')
-            v = v.strip()
-            if v.startswith('"') and v.endswith('"'):
-                v = v[1:-1]
-            else:
-                try:
-                    v = int(v)
-                except Exception:
-                    v = v.strip('"')
-            obj[k] = v
+    elif brace == "}":
         if obj:
             parsed.append(obj)
+        obj = None
+    elif obj is None:
+        continue
+    elif json_key:
+        try:
+            obj[json_key] = json.loads(json_value)
+        except ValueError:
+            obj[json_key] = json_value
+    else:
+        value = map_value.replace("\n", " ").strip()
+        if map_key != "title":
+            try:
+                value = int(value)
+            except ValueError:
+                pass
+        obj[map_key] = value
 
 if not parsed:
     print("Parsed 0 headings")
     raise SystemExit(0)
 
-print(f"Found {len(parsed)} candidate headings; showing top 30:\n")
-for i, item in enumerate(parsed[:30], 1):
-    title = item.get("title") or item.get('title') or ''
-    page = item.get("pageNumber") or item.get('pageNumber') or item.get('page')
-    level = item.get("level")
-    print(f"{i:2}. (p={page}, lvl={level}) {title}")
+lines = [
+    f"{i:2}. (p={item.get('pageNumber') or item.get('page')}, lvl={item.get('level')}) {item.get('title') or ''}"
+    for i, item in enumerate(parsed[:30], 1)
+]
+sys.stdout.write(f"Found {len(parsed)} candidate headings; showing top 30:\n\n" + "\n".join(lines) + "\n")